@@ -43,12 +43,24 @@ class Processor:
     def process_data(self):
         """Process the data"""
         print(f"Processing data from year 20{self.year}, month {self.start_month} to {self.end_month} for town {self.town}...")
-        self.zone_maps = self.storage_manager.zone_maps
-        zone_indexes = self.get_relevant_zones(self.zone_maps)
-        print("revelant zones")
-        print(zone_indexes)
+        # prune whole partitions before looking at any zone map
+        partition_cols = self.storage_manager.partition_cols
+        filters = {col: getattr(self, col) for col in partition_cols if col in ("town", "year")}
+        partitions = self.storage_manager.get_partitions(**filters)
 
-        stats = self.calculate_stats(zone_indexes)
+        individual_stats = []
+        relevant_zones = {}
+        for key in partitions:
+            partition = self.storage_manager.partitions[key]
+            self.zone_maps = partition["zone_maps"]
+            self.store_paths = partition["store_paths"]
+            zone_indexes = self.get_relevant_zones(self.zone_maps)
+            relevant_zones[key] = zone_indexes
+            individual_stats.extend(self.get_individual_stats(zone_indexes))
+        print("relevant zones per partition")
+        print(relevant_zones)
+
+        stats = self.calculate_stats(individual_stats)
 
         if stats is None:
             print("No results found")
@@ -59,17 +71,18 @@ class Processor:
         relevant_zones = []
         for idx, zone in enumerate(zone_maps):
             year_ok = zone["year"]["min"] <= self.year <= zone["year"]["max"]
-            month_ok = zone["month"]["min"] <= self.start_month or zone["month"]["max"] >= self.end_month
+            month_ok = zone["month"]["min"] <= self.end_month and zone["month"]["max"] >= self.start_month
             town_ok = zone["town"]["min"] <= self.town <= zone["town"]["max"]
             if year_ok and month_ok and town_ok:
                 relevant_zones.append(idx)
         return relevant_zones
     
-    def calculate_stats(self, zone_indexes):
-        individual_stats = self.get_individual_stats(zone_indexes)
+    def calculate_stats(self, individual_stats):
         s = None
 
         def pooled_standard_deviation(n1, s1, n2, s2):
+            if n1 + n2 <= 2:
+                return 0
             # Calculate the pooled variance
             variance1 = s1**2
             variance2 = s2**2
@@ -138,7 +151,7 @@ class Processor:
         town_ok, year_ok, month_ok = validity
         # may use start index and end index if the result is certainly continuous
         zone_stats = self.zone_maps[zone_idx]
-        valid_indexes = list(range(zone_stats["index_min"], zone_stats["index_max"]))
+        valid_indexes = list(range(zone_stats["index_min"], zone_stats["index_max"] + 1))
         if not town_ok:
             valid_indexes = self.filter_idx(zone_idx, valid_indexes, by="town")
         if not year_ok:
@@ -153,7 +166,11 @@ class Processor:
     
     def filter_idx(self, zone_idx, valid_indexes, by):
         assert by in ["town", "year", "month"], f"filter by {by} not implemented"
-        file_path = self.storage_manager.store_paths[by][zone_idx]
+        if by in self.storage_manager.partition_cols:
+            # partition columns are constant within a partition and have no column files
+            zone_value = self.zone_maps[zone_idx][by]["min"]
+            return valid_indexes if self.check_valid(zone_value, by) else []
+        file_path = self.store_paths[by][zone_idx]
         new_valid_indexes = []
         with open(file_path, "r", newline='') as file:
             print(f"reading file {file_path}")
@@ -182,7 +199,10 @@ class Processor:
 
                 if self.check_valid(row[by], by):
                     new_valid_indexes.append(row["index"])
-                row = self.storage_manager.preprocess_row(next(reader), "dict")
+                try:
+                    row = self.storage_manager.preprocess_row(next(reader), "dict")
+                except StopIteration:
+                    break
 
         return new_valid_indexes
                 
@@ -200,7 +220,7 @@ class Processor:
         elif "area" in self.query and "area" not in col:
             return None
     
-        file_path = self.storage_manager.store_paths[col][zone_idx]
+        file_path = self.store_paths[col][zone_idx]
         data = []
         with open(file_path, "r", newline='') as file:
             print(f'reading file {file_path}')
@@ -228,7 +248,10 @@ class Processor:
                     break
 
                 data.append(row[col])
-                row = self.storage_manager.preprocess_row(next(reader), "dict")
+                try:
+                    row = self.storage_manager.preprocess_row(next(reader), "dict")
+                except StopIteration:
+                    break
         return data
         
     def get_stats(self, area_data: List[int], price_data: List[int]):
@@ -240,12 +263,14 @@ class Processor:
             stats["num_data"] = len(area_data)
             stats["area_min"] = min(area_data)
             stats["area_avg"] = sum(area_data) / len(area_data)
-            stats["area_std"] = (sum((x - stats["area_avg"]) ** 2 for x in area_data) / (stats["num_data"]-1)) ** 0.5
+            stats["area_std"] = (sum((x - stats["area_avg"]) ** 2 for x in area_data) / (stats["num_data"]-1)) ** 0.5 \
+                                if stats["num_data"] > 1 else 0
         else:
             stats["num_data"] = len(price_data)
             stats["price_min"] = min(price_data)
             stats["price_avg"] = sum(price_data) / len(price_data)
-            stats["price_std"] = (sum((x - stats["price_avg"]) ** 2 for x in price_data) / (stats["num_data"]-1)) ** 0.5
+            stats["price_std"] = (sum((x - stats["price_avg"]) ** 2 for x in price_data) / (stats["num_data"]-1)) ** 0.5 \
+                                if stats["num_data"] > 1 else 0
 
         return stats
     
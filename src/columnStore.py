@@ -3,10 +3,15 @@ import os
 import shutil
 import heapq
 import math
+import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from typing import List, Dict, Tuple
 
 class ColumnStore:
 
+    ZONE_MAP_FILE = "zone_maps.json"
+
     def __init__(
         self, 
         original_data_file:str, 
@@ -15,7 +20,9 @@ class ColumnStore:
         zone_size:int, 
         chunk_size:int,
         mapper:Dict[str, str],
-        relevant_cols:list
+        relevant_cols:list,
+        partition_cols:list,
+        num_workers:int
     ) -> None:
         
         # deal with paths
@@ -42,11 +49,9 @@ class ColumnStore:
                     shutil.rmtree(item_path)
             os.removedirs(temp_path)
         os.makedirs(temp_path)
-        for col in relevant_cols:
-            column_path = os.path.join(column_store_folder, f"{col}")
-            if not os.path.exists(column_path):
-                os.makedirs(column_path)
-            print(f"making folder for column {col}")
+        assert len(partition_cols) > 0, "at least one partition column is required"
+        for col in partition_cols:
+            assert col in relevant_cols, f"partition column {col} is not a relevant column"
         
         self.original_data_file = original_data_file
         self.column_store_folder = column_store_folder
@@ -55,47 +60,123 @@ class ColumnStore:
         self.chunk_size = chunk_size
         self.mapper = mapper
         self.relevant_cols = relevant_cols
+        self.partition_cols = partition_cols
+        self.num_workers = num_workers
 
         self.temp_path = temp_path
-        self.store_paths = {col:[] for col in self.relevant_cols}
-        self.zone_maps = None
-
-    def sort_and_store(self):
-        # sort individual chunks
-        temp_files = self.sort_chunks()
-        self.temp_files = temp_files
-
-        # Merge the temporary files and calculate stats for each attribute
-        zone_maps = self.merge_chunks()
-        self.zone_maps = zone_maps
-        # print(zone_maps)
-    
-    def sort_chunks(self):
-        temp_files = []
-        chunk = []
+        # partition key, e.g. (town, year) -> {"zone_maps": [...], "store_paths": {col: [...]}}
+        self.partitions = self.load_partitions()
+
+    def sort_and_store(self, **filters):
+        """
+        Build the partitions matching filters, e.g. sort_and_store(town=3) only rebuilds town 3.
+        Without filters the whole store is rebuilt. Other partitions on disk are left untouched.
+        Each partition is merged into a staging folder and only replaces the old one once its merge
+        succeeded, so a failed rebuild keeps the previous data.
+        Partitions are merged in worker processes, so on spawn platforms (Windows, macOS) this must
+        be called under an `if __name__ == '__main__'` guard, as in main.py.
+        """
+        # split rows into partitions and sort individual chunks
+        partition_temp_files = self.sort_chunks(filters)
+
+        # merge the temporary files of each partition independently and in parallel
+        keys = list(partition_temp_files.keys())
+        staging_paths = [self.staging_path(key) for key in keys]
+        merge = partial(
+            ColumnStore.merge_chunks,
+            zone_size=self.zone_size,
+            relevant_cols=self.relevant_cols,
+            partition_cols=self.partition_cols,
+            mapper=self.mapper
+        )
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            results = executor.map(merge, [partition_temp_files[key] for key in keys], staging_paths)
+            for key, staging_path, zone_maps in zip(keys, staging_paths, results):
+                self.swap_partition(key, staging_path, zone_maps)
+
+        # partitions matching filters without any rows left in the input
+        for key in self.get_partitions(**filters):
+            if key not in partition_temp_files:
+                self.drop_partition(key)
+        if not filters:
+            self.drop_stale_folders()
+
+        # remove the parent temp folders (e.g. temp/town=<t>) emptied by the merges
+        for item in os.listdir(self.temp_path):
+            item_path = os.path.join(self.temp_path, item)
+            if os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+
+    def swap_partition(self, partition_key:Tuple, staging_path:str, zone_maps:List[Dict]):
+        """
+        Replace the partition on disk with its freshly merged staging folder
+        """
+        partition_path = self.partition_path(partition_key)
+        if os.path.exists(partition_path):
+            shutil.rmtree(partition_path)
+        os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+        shutil.move(staging_path, partition_path)
+        shutil.rmtree(os.path.join(self.temp_path, self.partition_dir(partition_key)))
+        self.partitions[partition_key] = {
+            "zone_maps": zone_maps,
+            "store_paths": self.get_store_paths(partition_path, len(zone_maps))
+        }
+
+    def drop_stale_folders(self, folder:str=None, depth:int=0):
+        """
+        Remove what does not belong to the current partition layout, e.g. the flat col_store/<col>/
+        folders of stores built before partitioning or partitions built with other partition columns
+        """
+        folder = self.column_store_folder if folder is None else folder
+        expected = {col for col in self.relevant_cols if col not in self.partition_cols}
+        expected.add(self.ZONE_MAP_FILE)
+        for item in sorted(os.listdir(folder)):
+            item_path = os.path.join(folder, item)
+            if depth < len(self.partition_cols):
+                col, _, val = item.partition("=")
+                if os.path.isdir(item_path) and col == self.partition_cols[depth] and val.lstrip("-").isdigit():
+                    self.drop_stale_folders(item_path, depth + 1)
+                    if not os.listdir(item_path):
+                        os.rmdir(item_path)
+                    continue
+            elif item in expected:
+                continue
+            print(f"removing {item_path} from a different storage layout")
+            if os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+            else:
+                os.remove(item_path)
+
+    def sort_chunks(self, filters:Dict[str, int]):
+        partition_temp_files = {}
+        chunks = {}
         with open(self.original_data_file, 'r', newline='') as file:
             reader = csv.DictReader(file)
             
             for row_index, raw_row in enumerate(reader):
-                # Extract attributes from the row and add row to chunk
+                # Extract attributes from the row and add row to the chunk of its partition
                 row = self.preprocess_row(raw_row, "dict")
-                chunk.append(row)
+                key = self.partition_key(row)
+                if self.match_partition(key, filters):
+                    chunks.setdefault(key, []).append(row)
                 
                 if (row_index + 1) % self.chunk_size == 0:
-                    # Sort the chunk by the composite key before writing to temp file
-                    sorted_chunk = sorted(chunk, key=self.composite_key_func)
-                    temp_file_path = self.write_chunk_to_temp_files(sorted_chunk, len(temp_files))
-                    temp_files.append(temp_file_path)
-                    chunk = []  # Reset chunksfor next round
+                    self.flush_chunks(chunks, partition_temp_files)
+                    chunks = {}  # Reset chunks for next round
 
-            # After all rows have been processed, handle any remaining rows in the last chunk
-            if chunk:
-                # Sort the chunk by the composite key before writing to temp file
-                sorted_chunk = sorted(chunk, key=self.composite_key_func)
-                temp_file_path = self.write_chunk_to_temp_files(sorted_chunk, len(temp_files))
-                temp_files.append(temp_file_path)
+            # After all rows have been processed, handle any remaining rows in the last chunks
+            if chunks:
+                self.flush_chunks(chunks, partition_temp_files)
 
-        return temp_files
+        return partition_temp_files
+
+    def flush_chunks(self, chunks:Dict[Tuple, List], partition_temp_files:Dict[Tuple, List[str]]):
+        for key, chunk in chunks.items():
+            temp_files = partition_temp_files.setdefault(key, [])
+            # Sort the chunk by the composite key before writing to temp file
+            sorted_chunk = sorted(chunk, key=self.composite_key_func)
+            temp_file_path = self.write_chunk_to_temp_files(sorted_chunk, key, len(temp_files))
+            temp_files.append(temp_file_path)
 
     def composite_key_func(self, row:Dict[str, str]):
         year = row['year']
@@ -103,9 +184,81 @@ class ColumnStore:
         town = row['town']
         return (town, year, month)
 
-    def write_chunk_to_temp_files(self, chunk, chunk_number):
+    def partition_key(self, row:Dict[str, int]):
+        return tuple(row[col] for col in self.partition_cols)
+
+    def partition_dir(self, partition_key:Tuple):
+        return os.path.join(*(f"{col}={val}" for col, val in zip(self.partition_cols, partition_key)))
+
+    def partition_path(self, partition_key:Tuple):
+        return os.path.join(self.column_store_folder, self.partition_dir(partition_key))
+
+    def staging_path(self, partition_key:Tuple):
+        return os.path.join(self.temp_path, self.partition_dir(partition_key), "partition")
+
+    def get_store_paths(self, partition_path:str, num_zones:int):
+        return {
+            col:[os.path.join(partition_path, f"{col}", f"{n}.csv") for n in range(num_zones)]
+            for col in self.relevant_cols if col not in self.partition_cols
+        }
+
+    def match_partition(self, partition_key:Tuple, filters:Dict[str, int]):
+        return all(filters[col] == val for col, val in zip(self.partition_cols, partition_key) if col in filters)
+
+    def get_partitions(self, **filters):
+        """
+        Return the keys of the partitions matching filters, e.g. get_partitions(town=3, year=21).
+        Partitions that do not match are pruned without reading their zone maps.
+        """
+        for col in filters:
+            assert col in self.partition_cols, f"{col} is not a partition column"
+        return sorted(key for key in self.partitions if self.match_partition(key, filters))
+
+    def drop_partitions(self, **filters):
+        """
+        Remove the partitions matching filters from disk, e.g. drop_partitions(year=21).
+        """
+        for key in self.get_partitions(**filters):
+            self.drop_partition(key)
+
+    def drop_partition(self, partition_key:Tuple):
+        partition_path = self.partition_path(partition_key)
+        print(f"removing partition {partition_path}")
+        shutil.rmtree(partition_path)
+        del self.partitions[partition_key]
+        # remove parent folders (e.g. town=<t>) left empty
+        parent = os.path.dirname(partition_path)
+        while parent != self.column_store_folder and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    def load_partitions(self):
+        """
+        Discover the partitions already on disk from the folder structure and their zone map files
+        """
+        for col in self.relevant_cols:
+            if os.path.isdir(os.path.join(self.column_store_folder, f"{col}")):
+                print(f"Warning: found unpartitioned column folder for {col}, it is removed on a full rebuild")
+        partitions = {}
+        for dirpath, _, filenames in os.walk(self.column_store_folder):
+            if self.ZONE_MAP_FILE not in filenames:
+                continue
+            parts = os.path.relpath(dirpath, self.column_store_folder).split(os.sep)
+            cols = tuple(part.split("=")[0] for part in parts)
+            if cols != tuple(self.partition_cols):
+                print(f"Warning: skipping folder with a different partition layout, it is removed on a full rebuild: {dirpath}")
+                continue
+            key = tuple(int(part.split("=")[1]) for part in parts)
+            with open(os.path.join(dirpath, self.ZONE_MAP_FILE), "r") as file:
+                zone_maps = json.load(file)
+            partitions[key] = {"zone_maps": zone_maps, "store_paths": self.get_store_paths(dirpath, len(zone_maps))}
+        return partitions
+
+    def write_chunk_to_temp_files(self, chunk, partition_key, chunk_number):
+        temp_folder = os.path.join(self.temp_path, self.partition_dir(partition_key))
+        os.makedirs(temp_folder, exist_ok=True)
         temp_file_path = f'temp_sorted_chunk_{chunk_number}.csv'
-        temp_file_path = os.path.join(self.temp_path, temp_file_path)
+        temp_file_path = os.path.join(temp_folder, temp_file_path)
         with open(temp_file_path, 'w', newline='') as temp_file:
             fieldnames = chunk[0].keys()
             writer = csv.DictWriter(temp_file, fieldnames=fieldnames)
@@ -113,61 +266,87 @@ class ColumnStore:
             writer.writerows(chunk)
         return temp_file_path
 
-    def merge_chunks(self):
+    @staticmethod
+    def merge_chunks(
+        temp_files:List[str],
+        partition_path:str,
+        zone_size:int,
+        relevant_cols:list,
+        partition_cols:list,
+        mapper:Dict[str, str]
+    ):
+        """
+        Merge the sorted temp files of one partition into zones under <partition_path>/<col>/<n>.csv.
+        Only takes the configuration it needs and only touches its own folder, so partitions can be
+        merged in parallel worker processes.
+        """
+        for col in relevant_cols:
+            if col not in partition_cols:
+                os.makedirs(os.path.join(partition_path, f"{col}"), exist_ok=True)
+
         pq = []
         file_handles = []
         zone_maps = []
-        zone = {col:[] for col in self.relevant_cols}
+        zone = {col:[] for col in relevant_cols}
         zone["indexes"] = []
         numbers = 0  # Counter for the number of records processed
 
-        for temp_file_path in self.temp_files:
+        for file_number, temp_file_path in enumerate(temp_files):
             try:
                 file_handle = open(temp_file_path, 'r', newline='')
                 reader = csv.DictReader(file_handle)
                 file_handles.append((file_handle, reader))
-                row = self.preprocess_row(next(reader), "list")
-                heapq.heappush(pq, (row, file_handle, reader))
+                row = ColumnStore.parse_row(next(reader), "list", relevant_cols, mapper)
+                # file_number breaks ties between identical rows
+                heapq.heappush(pq, (row, file_number, file_handle, reader))
             except (FileNotFoundError, StopIteration) as e:
                 print(f"Warning: file not found or empty: {temp_file_path}")
                 continue
 
         while pq:
-            row, file_handle, reader = heapq.heappop(pq)
-            for col, val in zip(self.relevant_cols, row):
+            row, file_number, file_handle, reader = heapq.heappop(pq)
+            for col, val in zip(relevant_cols, row):
                 zone[col].append(val)
             zone["indexes"].append(numbers)
             numbers += 1
 
             # If a new zone must be started or if it's the first zone, open a new file and reset stats
-            if numbers % self.zone_size == 0:
-                self.write_rows(zone)
-                zone_stats = self.get_zone_stats(zone)
+            if numbers % zone_size == 0:
+                ColumnStore.write_rows(zone, partition_path, len(zone_maps), partition_cols)
+                zone_stats = ColumnStore.get_zone_stats(zone)
                 zone_maps.append(zone_stats)
-                zone = {col:[] for col in self.relevant_cols}
+                zone = {col:[] for col in relevant_cols}
                 zone["indexes"] = []
             
             try:
-                next_row = self.preprocess_row(next(reader), "list")
-                heapq.heappush(pq, (next_row, file_handle, reader))
+                next_row = ColumnStore.parse_row(next(reader), "list", relevant_cols, mapper)
+                heapq.heappush(pq, (next_row, file_number, file_handle, reader))
             except StopIteration:
                 file_handle.close()
 
-        # Close the file handle if it is still open and update the stats for the last zone
+        # Write and update the stats for the last, potentially partial, zone
         if len(zone['indexes']) != 0:
-            if numbers > 0:
-                zone_stats = self.get_zone_stats(zone)  # Update zone stats for the last, potentially partial, zone
-                zone_maps.append(zone_stats)
+            ColumnStore.write_rows(zone, partition_path, len(zone_maps), partition_cols)
+            zone_stats = ColumnStore.get_zone_stats(zone)
+            zone_maps.append(zone_stats)
 
         # Clean up file handles and temporary files
         for file_handle, _ in file_handles:
             file_handle.close()
-        for temp_file_path in self.temp_files:
+        for temp_file_path in temp_files:
             os.remove(temp_file_path)
 
+        # persist zone maps with the partition so it can be loaded without re-ingesting
+        with open(os.path.join(partition_path, ColumnStore.ZONE_MAP_FILE), "w") as file:
+            json.dump(zone_maps, file)
+
         return zone_maps
 
     def preprocess_row(self, row:Dict[str, str], return_type:str):
+        return ColumnStore.parse_row(row, return_type, self.relevant_cols, self.mapper)
+
+    @staticmethod
+    def parse_row(row:Dict[str, str], return_type:str, relevant_cols:list, mapper:Dict[str, str]):
         # this function processes row read from any csv file
         def process_dict(row, col, value):
             row[col] = value
@@ -185,7 +364,7 @@ class ColumnStore:
             raise NotImplementedError(f"return_type {return_type} is not implemented")
         
         try:
-            cols = self.relevant_cols if len(self.relevant_cols) <= len(row.keys()) else row.keys()
+            cols = relevant_cols if len(relevant_cols) <= len(row.keys()) else row.keys()
             if len(row.keys()) == 2: # processing column stored rows
                 value_mapping = {col:float(row[col]) if "." in row[col] else int(row[col]) for col in cols}
             else:
@@ -193,7 +372,7 @@ class ColumnStore:
                     "year": int(row["year"]) if "year" in row else int(row["month"].split("-")[0][2:]),
                     "month": int(row["month"]) if "year" in row else int(row["month"].split("-")[1]),
                     "town": int(row['town']) if row['town'].replace("-", "").isdigit() \
-                            else self.mapper['town2num'].get(row['town'], -1)
+                            else mapper['town2num'].get(row['town'], -1)
                 }
             for col in cols:
                 value = value_mapping.get(col, None) # uses None because float(row[col]) may cause bugs
@@ -206,34 +385,35 @@ class ColumnStore:
         
         return new_row
 
-    def write_rows(self, rows:Dict[str, List]):
+    @staticmethod
+    def write_rows(rows:Dict[str, List], partition_path:str, zone_number:int, partition_cols:list):
         """
-        This function write each column of rows into seperate files to implement column store
+        This function write each column of rows into seperate files to implement column store.
+        Partition columns are constant within a partition and are kept in the zone maps only.
         """
         num_rows = len(rows["indexes"])
-        num_zones = len(self.store_paths[self.relevant_cols[0]])
         for col, value_list in rows.items():
-            if col=="indexes":
+            if col=="indexes" or col in partition_cols:
                 continue
             assert len(value_list) == num_rows, f"number of rows are not consistent for column {col}"
 
-            store_path = os.path.join(self.column_store_folder, f"{col}", f"{num_zones}.csv")
+            store_path = os.path.join(partition_path, f"{col}", f"{zone_number}.csv")
             with open(store_path, "w", newline='') as file:
                 field_names = ["index", col]
                 writer = csv.DictWriter(file, fieldnames=field_names)
                 writer.writeheader()
                 rows_col = [{"index": idx, col:val} for idx, val in zip(rows["indexes"], value_list)]
                 writer.writerows(rows_col)
-                self.store_paths[col].append(store_path)
 
-    def get_zone_stats(self, zone:Dict[str, List]):
+    @staticmethod
+    def get_zone_stats(zone:Dict[str, List]):
         zone_stat = {}
         # Calculate and store zone statistics
         for col, value_list in zone.items():
             if col=="indexes":
                 continue
             zone_stat[col] = {}
-            mini, maxi, mean, std_dev, n= self.calculate_statistics(value_list)
+            mini, maxi, mean, std_dev, n= ColumnStore.calculate_statistics(value_list)
             zone_stat[col]["min"] = mini
             zone_stat[col]["max"] = maxi
             zone_stat[col]["avg"] = mean
@@ -244,7 +424,8 @@ class ColumnStore:
         zone_stat["index_max"] = max(zone["indexes"])
         return zone_stat
 
-    def calculate_statistics(self, data:list):
+    @staticmethod
+    def calculate_statistics(data:list):
         n = len(data)
         mean = sum(data) / n
         variance = sum((x - mean) ** 2 for x in data) / n
@@ -7,6 +7,8 @@ from project_config import (
     ZONE_SIZE,
     MAPPER,
     RELEVANT_COLS,
+    PARTITION_COLS,
+    NUM_WORKERS,
     QUERY_TYPES
 )
 from typing import List, Dict, Tuple
@@ -28,7 +30,9 @@ def main() -> None:
                                   zone_size=ZONE_SIZE,
                                   chunk_size=TEMP_FILE_SIZE,
                                   mapper=MAPPER,
-                                  relevant_cols=RELEVANT_COLS
+                                  relevant_cols=RELEVANT_COLS,
+                                  partition_cols=PARTITION_COLS,
+                                  num_workers=NUM_WORKERS
                                   )
     # do the sorting and column store
     storage_manager.sort_and_store()
@@ -5,6 +5,7 @@ COLUMN_STORE_FOLDER = 'col_store'
 RESULTS_FOLDER = 'results'
 ZONE_SIZE = 10000
 TEMP_FILE_SIZE = 20000
+NUM_WORKERS = 4
 MAPPER = {
     'num2town':{
         '0': 'ANG MO KIO',
@@ -42,6 +43,12 @@ RELEVANT_COLS = (
     'resale_price'
 )
 
+# columns used for the on-disk layout, e.g. col_store/town=0/year=21/<col>/<n>.csv
+PARTITION_COLS = (
+    'town',
+    'year'
+)
+
 QUERY_TYPES = [
     "Minimum Area",
     "Average Area",
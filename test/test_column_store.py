@@ -0,0 +1,175 @@
+import csv
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from project_config import MAPPER, RELEVANT_COLS, KEY_MAPPING
+from columnStore import ColumnStore
+from Processor import Processor
+
+YEARS = (2019, 2020, 2021)
+
+
+def write_data_file(path, num_rows=600, bad_town=None):
+    random.seed(4123)
+    towns = list(MAPPER["town2num"].keys())
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["month", "town", "flat_type", "floor_area_sqm", "resale_price"])
+        for _ in range(num_rows):
+            town = random.choice(towns)
+            area = round(random.uniform(40, 150), 1)
+            if town == bad_town:
+                area = "not a number"
+            writer.writerow([
+                f"{random.choice(YEARS)}-{random.randint(1, 12):02d}",
+                town,
+                "4 ROOM",
+                area,
+                float(random.randint(200000, 900000)),
+            ])
+
+
+def make_store(tmp_path, zone_size=50, partition_cols=("town", "year")):
+    return ColumnStore(
+        original_data_file=str(tmp_path / "data.csv"),
+        column_store_folder=str(tmp_path / "col_store"),
+        results_folder=str(tmp_path / "results"),
+        zone_size=zone_size,
+        chunk_size=100,
+        mapper=MAPPER,
+        relevant_cols=RELEVANT_COLS,
+        partition_cols=partition_cols,
+        num_workers=2,
+    )
+
+
+def read_files(folder):
+    contents = {}
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as file:
+                contents[os.path.relpath(path, folder)] = file.read()
+    return contents
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_data_file(tmp_path / "data.csv")
+    storage_manager = make_store(tmp_path)
+    storage_manager.sort_and_store()
+    return storage_manager
+
+
+@pytest.mark.parametrize("partition_cols", [("town", "year"), ("year",), ("year", "month")])
+@pytest.mark.parametrize("zone_size", [7, 50, 10000])
+def test_queries_match_brute_force(tmp_path, monkeypatch, zone_size, partition_cols):
+    monkeypatch.chdir(tmp_path)
+    write_data_file(tmp_path / "data.csv")
+    storage_manager = make_store(tmp_path, zone_size, partition_cols)
+    storage_manager.sort_and_store()
+
+    results = []
+    monkeypatch.setattr(Processor, "write_results", lambda self, stats: results.append(stats))
+    with open(tmp_path / "data.csv", newline="") as file:
+        rows = list(csv.DictReader(file))
+
+    for town, month, year in [(3, 1, 0), (9, 0, 9), (0, 5, 1)]:
+        matric_num = f"U2000{town}{month}{year}X"
+        for query in ["Minimum Area", "Average Area", "Minimum Price", "Average Price"]:
+            results.clear()
+            processor = Processor(matric_num=matric_num, query=query, storage_manager=storage_manager)
+            processor.process_data()
+
+            expected = [
+                float(row["floor_area_sqm"] if "area" in processor.query else row["resale_price"])
+                for row in rows
+                if row["town"] == MAPPER["num2town"][str(town)]
+                and int(row["month"][2:4]) == processor.year
+                and processor.start_month <= int(row["month"][5:]) <= processor.end_month
+            ]
+            expected = min(expected) if "minimum" in processor.query else sum(expected) / len(expected)
+            assert results[0][KEY_MAPPING[processor.query]] == pytest.approx(expected)
+
+
+def test_get_partitions_prunes(store):
+    assert len(store.get_partitions()) == 30
+    assert store.get_partitions(town=3) == [(3, 19), (3, 20), (3, 21)]
+    assert store.get_partitions(town=3, year=20) == [(3, 20)]
+    assert store.get_partitions(year=22) == []
+
+
+def test_rebuild_town_leaves_other_partitions_untouched(store, tmp_path):
+    col_store = tmp_path / "col_store"
+    before = read_files(col_store)
+    other_files = {path: data for path, data in before.items() if not path.startswith("town=3")}
+    for path in other_files:
+        os.utime(col_store / path, (0, 0))
+
+    store.sort_and_store(town=3)
+
+    after = read_files(col_store)
+    assert {path: data for path, data in after.items() if not path.startswith("town=3")} == other_files
+    assert all(os.stat(col_store / path).st_mtime == 0 for path in other_files)
+    assert {path for path in after if path.startswith("town=3")} == \
+           {path for path in before if path.startswith("town=3")}
+    assert store.get_partitions(town=3) == [(3, 19), (3, 20), (3, 21)]
+    assert os.listdir(tmp_path / "temp") == []
+
+
+def test_drop_partitions_removes_empty_parent_folders(store, tmp_path):
+    col_store = tmp_path / "col_store"
+    store.drop_partitions(year=20)
+    assert store.get_partitions(year=20) == []
+    assert len(store.get_partitions()) == 20
+    assert not any((col_store / f"town={town}" / "year=20").exists() for town in range(10))
+
+    store.drop_partitions(town=3)
+    assert not (col_store / "town=3").exists()
+    assert (col_store / "town=4").exists()
+
+
+def test_reload_from_zone_maps(store, tmp_path):
+    reloaded = make_store(tmp_path)
+    assert reloaded.partitions == store.partitions
+
+
+def test_failed_rebuild_keeps_partitions(store, tmp_path):
+    before = read_files(tmp_path / "col_store")
+    write_data_file(tmp_path / "data.csv", bad_town="CLEMENTI")
+    with pytest.raises(ValueError):
+        store.sort_and_store(town=3)
+    assert read_files(tmp_path / "col_store") == before
+    assert store.get_partitions(town=3) == [(3, 19), (3, 20), (3, 21)]
+
+
+def test_full_rebuild_removes_other_layouts(store, tmp_path):
+    col_store = tmp_path / "col_store"
+    # flat folders from before partitioning and a partition from PARTITION_COLS = ("town",)
+    os.makedirs(col_store / "resale_price")
+    (col_store / "resale_price" / "0.csv").write_text("index,resale_price\n")
+    os.makedirs(col_store / "town=3" / "month")
+    (col_store / "town=3" / "zone_maps.json").write_text("[]")
+    os.makedirs(col_store / "town=42" / "year")
+
+    store.sort_and_store()
+
+    assert not (col_store / "resale_price").exists()
+    assert not (col_store / "town=3" / "month").exists()
+    assert not (col_store / "town=3" / "zone_maps.json").exists()
+    assert not (col_store / "town=42").exists()
+    assert sorted(os.listdir(col_store / "town=3")) == ["year=19", "year=20", "year=21"]
+    assert make_store(tmp_path).partitions == store.partitions
+
+
+def test_partition_cols_required(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_data_file(tmp_path / "data.csv")
+    with pytest.raises(AssertionError):
+        make_store(tmp_path, partition_cols=())